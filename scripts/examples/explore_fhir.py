@@ -1,4 +1,5 @@
 import asyncio
+from src.tools.fhir_tools.client import close_async_http_clients
 from src.tools.fhir_tools.explorer import FHIRExplorer
 
 
@@ -9,7 +10,9 @@ async def main():
 
     # Explore Patient resource structure
     print("\nExploring Patient resource structure:")
-    patient_structure = await explorer.explore_resource_structure("Patient")
+    patient_structure = await explorer.explore_resource_structure(
+        "Patient", include_sample=True
+    )
     print("\nPatient Structure:", patient_structure)
 
     # Explore relationships
@@ -17,6 +20,8 @@ async def main():
     relationships = await explorer.get_resource_relationships("example", "Patient")
     print("\nRelationships:", relationships)
 
+    await close_async_http_clients()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,16 +1,95 @@
 import asyncio
-import json
+import multiprocessing
 import os
-from typing import Optional, Dict, List, TYPE_CHECKING
+from multiprocessing.connection import Connection
+from typing import Optional, Dict, FrozenSet, List, Set, Tuple, TYPE_CHECKING
 from pathlib import Path
-from src.models.ollama import OllamaClient
+from types import CodeType
+import orjson
+from src.models.ollama import OllamaClient, close_shared_client
 from src.tools.fhir_tools.client import FHIRClient
 from src.tools.fhir_tools.explorer import FHIRExplorer
+from pygments.lexers.python import PythonLexer
 from rich.console import Console
 from rich.panel import Panel
 from rich.syntax import Syntax
 from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
 from datetime import datetime
+from functools import lru_cache
+
+
+# Static prompt modules shared by every request. They are joined into one
+# constant system prompt that precedes any per-attempt text, and evaluated once
+# at startup so Ollama can reuse the cached prefix across attempts and tasks.
+PROMPT_MODULES = {
+    "fhir_system": """You are a Python expert specializing in healthcare data integration.
+Your task is to write executable Python code that uses the provided client instance.
+
+IMPORTANT:
+1. The client instance is already provided as 'client'
+2. Return ONLY valid Python code
+3. Do not create new client instances
+4. Include proper error handling
+5. Use the rich library for output formatting""",
+    "fhir_scaffold": """Example of valid code structure:
+def main():
+    '''Function to demonstrate FHIR client usage'''
+    try:
+        patient = client.get_patient('example')
+        print(f"Patient data: {patient}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()""",
+}
+
+SYSTEM_PROMPT = "\n\n".join(PROMPT_MODULES.values())
+
+
+# Independent training tasks; they run concurrently and share the cached
+# system prompt prefix
+TASKS = [
+    "Write a program that retrieves a patient with ID 'example' using the provided client instance and prints their name and birth date. Handle any potential errors.",
+]
+
+# Upper bound on tasks talking to Ollama at the same time
+MAX_CONCURRENT_TASKS = 3
+
+
+# Longest code snippet quoted from history in an enhanced prompt, and the most
+# past solutions quoted
+MAX_SNIPPET_CHARS = 2000
+MAX_SIMILAR_TASKS = 5
+
+# Seconds to wait before writing buffered attempts to the history log, and
+# the number of buffered attempts that forces an immediate write
+HISTORY_FLUSH_DELAY = 0.02
+HISTORY_FLUSH_BATCH = 500
+
+# Seconds a generated snippet may run before its worker is killed
+EXECUTION_TIMEOUT = 30
+
+
+@lru_cache(maxsize=256)
+def _task_words(task: str) -> FrozenSet[str]:
+    """Distinct lower-cased words of a task; the same tasks recur across attempts"""
+    return frozenset(task.lower().split())
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to limit characters, returning short text as-is"""
+    return text if len(text) <= limit else text[:limit]
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """Replace a file's contents so readers see either the old or new version"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
 
 # First define the class so it can be used in type hints
@@ -18,61 +97,239 @@ class FHIRAgentTrainer:
     def __init__(self):
         self.knowledge_base_path = Path("training_history")
         self.knowledge_base_path.mkdir(exist_ok=True)
+        # Attempts are appended one per line as they happen; the small pattern
+        # tables are snapshotted separately when the session is saved
+        self.history_file = self.knowledge_base_path / "training_history.jsonl"
+        self.patterns_file = self.knowledge_base_path / "knowledge_base.json"
         self.session_history: List[Dict] = []
+        # Rendered prompts, keyed by (knowledge base version, task, error); the
+        # version is bumped whenever prompt inputs change
+        self._prompt_cache: Dict[Tuple[int, str, Optional[str]], str] = {}
+        # find_similar_tasks results per task, valid until the index changes
+        self._similar_cache: Dict[str, List[Dict]] = {}
+        self._kb_version = 0
+        # Error types each task has failed with and not yet recovered from
+        self._unsolved_errors: Dict[str, Set[str]] = {}
         self.load_knowledge_base()
+        self.history_log = open(self.history_file, "ab")
+        # Attempts recorded close together are written to the log in one go
+        self._pending_history: List[Tuple[bytes, Dict]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # (log offset, attempt) for this session's attempts, indexed on save
+        self._unindexed: List[Tuple[int, Dict]] = []
 
     def load_knowledge_base(self):
-        """Load previous training sessions and successful solutions"""
-        history_file = self.knowledge_base_path / "training_history.json"
-        if history_file.exists():
-            with open(history_file, "r") as f:
-                self.knowledge_base = json.load(f)
+        """Load successful solutions and index previous training sessions
+
+        Only the log offsets of successful attempts are kept in memory; full
+        records are read back from the history log when a lookup needs them.
+        """
+        self._migrate_legacy_history()
+
+        if self.patterns_file.exists():
+            with open(self.patterns_file, "rb") as f:
+                self.knowledge_base = orjson.loads(f.read())
         else:
             self.knowledge_base = {
                 "successful_patterns": {},
                 "error_solutions": {},
-                "task_history": [],
             }
 
+        self.task_offsets: List[int] = []
+        self.task_index: Dict[str, List[int]] = {}
+        if self.history_file.exists():
+            with open(self.history_file, "rb") as f:
+                offset = 0
+                for line in f:
+                    if line.strip():
+                        self._index_task(offset, orjson.loads(line))
+                    offset += len(line)
+
+    def _migrate_legacy_history(self):
+        """Convert a single-file training_history.json into the log and snapshot
+
+        Older versions kept the patterns and every attempt in one JSON file.
+        Its attempts are placed ahead of any already in the log, its patterns
+        are merged under the current ones, and the file is renamed so the
+        migration runs once. Each file is replaced atomically and the legacy
+        file is renamed last, so an interrupted migration is simply redone.
+        """
+        legacy_file = self.knowledge_base_path / "training_history.json"
+        if not legacy_file.exists():
+            return
+
+        with open(legacy_file, "rb") as f:
+            legacy = orjson.loads(f.read())
+
+        legacy_log = b"".join(
+            orjson.dumps(entry) + b"\n" for entry in legacy.get("task_history", [])
+        )
+        existing_log = b""
+        if self.history_file.exists():
+            with open(self.history_file, "rb") as f:
+                existing_log = f.read()
+        # A rerun after an interruption finds the entries already in place
+        if legacy_log and not existing_log.startswith(legacy_log):
+            _write_atomic(self.history_file, legacy_log + existing_log)
+
+        patterns = {"successful_patterns": {}, "error_solutions": {}}
+        if self.patterns_file.exists():
+            with open(self.patterns_file, "rb") as f:
+                patterns = orjson.loads(f.read())
+        for name in ("successful_patterns", "error_solutions"):
+            patterns[name] = {**legacy.get(name, {}), **patterns[name]}
+        _write_atomic(
+            self.patterns_file, orjson.dumps(patterns, option=orjson.OPT_INDENT_2)
+        )
+
+        legacy_file.rename(legacy_file.with_suffix(".json.migrated"))
+
+    def _index_task(self, offset: int, entry: Dict):
+        """Record a successful attempt's log offset and map its task words to it"""
+        if not entry["success"]:
+            return
+        position = len(self.task_offsets)
+        self.task_offsets.append(offset)
+        for word in _task_words(entry["task"]):
+            self.task_index.setdefault(word, []).append(position)
+
     def save_training_session(self):
-        """Save the current session's learnings"""
+        """Save the current session's learnings
+
+        Attempts are already in the append-only history log, so only the
+        session file and the pattern snapshot are written here.
+        """
+        self.flush_history()
+        self.history_log.close()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
         # Save session history
         session_file = self.knowledge_base_path / f"session_{timestamp}.json"
-        with open(session_file, "w") as f:
-            json.dump(self.session_history, f, indent=2)
-
-        # Update and save knowledge base
-        self.knowledge_base["task_history"].extend(self.session_history)
-        with open(self.knowledge_base_path / "training_history.json", "w") as f:
-            json.dump(self.knowledge_base, f, indent=2)
+        with open(session_file, "wb") as f:
+            f.write(orjson.dumps(self.session_history, option=orjson.OPT_INDENT_2))
+
+        # Update knowledge base and save the pattern snapshot
+        for offset, entry in self._unindexed:
+            self._index_task(offset, entry)
+        self._unindexed.clear()
+        self._similar_cache.clear()
+        self._kb_version += 1
+        patterns = {
+            "successful_patterns": self.knowledge_base["successful_patterns"],
+            "error_solutions": self.knowledge_base["error_solutions"],
+        }
+        with open(self.patterns_file, "wb") as f:
+            f.write(orjson.dumps(patterns, option=orjson.OPT_INDENT_2))
+
+    def _schedule_flush(self):
+        """Flush shortly after the first pending attempt, or now if no loop runs"""
+        if len(self._pending_history) >= HISTORY_FLUSH_BATCH:
+            self.flush_history()
+            return
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_history()
+            return
+        self._flush_handle = loop.call_later(HISTORY_FLUSH_DELAY, self.flush_history)
+
+    def flush_history(self):
+        """Write all buffered attempts to the history log in a single call"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending_history:
+            offset = self.history_log.tell()
+            for line, attempt in self._pending_history:
+                self._unindexed.append((offset, attempt))
+                offset += len(line)
+            self.history_log.write(b"".join(line for line, _ in self._pending_history))
+            self.history_log.flush()
+            self._pending_history.clear()
 
     def get_enhanced_prompt(self, task: str, error: Optional[str] = None) -> str:
-        """Build prompt using knowledge base and previous solutions"""
+        """Build prompt using knowledge base and previous solutions
+
+        Context that changes least between attempts comes first; the task and
+        then the previous attempt's error go last, keeping the shared prefix
+        as long as possible. Retries with unchanged inputs reuse the
+        previously rendered prompt.
+        """
+        key = (self._kb_version, task, error)
+        cached = self._prompt_cache.get(key)
+        if cached is not None:
+            return cached
+
+        error_type = error.split(":")[0] if error else None
         similar_tasks = self.find_similar_tasks(task)
 
-        prompt_parts = [task]
+        prompt_parts = []
 
         if similar_tasks:
-            prompt_parts.append("\nPrevious successful approaches:")
+            prompt_parts.append("Previous successful approaches:")
             for t in similar_tasks:
-                prompt_parts.append(f"- {t['solution_pattern']}")
+                prompt_parts.append(f"- {_truncate(t['code'], MAX_SNIPPET_CHARS)}")
+            prompt_parts.append("")
+
+        if error_type and error_type in self.knowledge_base["error_solutions"]:
+            prompt_parts.append(f"Previous solution for {error_type}:")
+            prompt_parts.append(
+                _truncate(
+                    self.knowledge_base["error_solutions"][error_type],
+                    MAX_SNIPPET_CHARS,
+                )
+            )
+            prompt_parts.append("")
 
-        if error and error in self.knowledge_base["error_solutions"]:
-            prompt_parts.append(f"\nPrevious solution for {error}:")
-            prompt_parts.append(self.knowledge_base["error_solutions"][error])
+        prompt_parts.append(task)
 
-        return "\n".join(prompt_parts)
+        if error:
+            prompt_parts.append("")
+            prompt_parts.append(f"The previous attempt failed with: {error}")
+            prompt_parts.append("Fix this error in the new code.")
+
+        prompt = "\n".join(prompt_parts)
+        self._prompt_cache[key] = prompt
+        return prompt
 
     def find_similar_tasks(self, task: str) -> List[Dict]:
-        """Find similar tasks from history (simplified - could use embeddings)"""
-        return [
-            t
-            for t in self.knowledge_base["task_history"]
-            if t["success"]
-            and any(word in task.lower() for word in t["task"].lower().split())
-        ]
+        """Find similar tasks from history (simplified - could use embeddings)
+
+        Each distinct word seen in successful tasks is tested against the task
+        once, rather than rescanning every word of every history entry. At
+        most MAX_SIMILAR_TASKS of the most recent distinct solutions are
+        returned.
+        """
+        cached = self._similar_cache.get(task)
+        if cached is not None:
+            return cached
+
+        query = task.lower()
+        positions = set()
+        for word, word_positions in self.task_index.items():
+            if word in query:
+                positions.update(word_positions)
+
+        # Newest first, one entry per distinct solution, so a task solved in
+        # every session is quoted once
+        similar_tasks = []
+        seen_code = set()
+        if positions:
+            with open(self.history_file, "rb") as f:
+                for position in sorted(positions, reverse=True):
+                    f.seek(self.task_offsets[position])
+                    entry = orjson.loads(f.readline())
+                    if entry["code"] in seen_code:
+                        continue
+                    seen_code.add(entry["code"])
+                    similar_tasks.append(entry)
+                    if len(similar_tasks) == MAX_SIMILAR_TASKS:
+                        break
+
+        self._similar_cache[task] = similar_tasks
+        return similar_tasks
 
     def record_attempt(
         self, task: str, code: str, success: bool, error: Optional[str] = None
@@ -86,139 +343,311 @@ class FHIRAgentTrainer:
             "error": error,
         }
         self.session_history.append(attempt)
+        self._pending_history.append((orjson.dumps(attempt) + b"\n", attempt))
+        self._schedule_flush()
 
         if success:
             # Store successful pattern
             self.knowledge_base["successful_patterns"][task] = code
+            # This code solved the errors the task failed with earlier
+            solved = self._unsolved_errors.pop(task, set())
+            for error_type in solved:
+                if error_type not in self.knowledge_base["error_solutions"]:
+                    self.knowledge_base["error_solutions"][error_type] = code
+                    self._kb_version += 1
         elif error:
-            # Store error solution if this error was solved
-            error_type = error.split(":")[0]
-            if error_type not in self.knowledge_base["error_solutions"]:
-                self.knowledge_base["error_solutions"][error_type] = code
+            self._unsolved_errors.setdefault(task, set()).add(error.split(":")[0])
 
 
 console = Console()
 
+# Built once; Syntax would otherwise look up and construct a lexer per panel
+PYTHON_LEXER = PythonLexer()
+
+# Openings of the prose lines the model writes around its code
+_EXPLANATION_PREFIXES = ("Here", "I ", "Note", "This", "The", "To")
+
+
+class CodeCleaner:
+    """Strip markdown fences and explanatory text from model output as it streams
+
+    Complete lines are classified as soon as they arrive, so the cleaned code
+    is ready when generation ends without another pass over the response.
+    """
+
+    def __init__(self):
+        self.code_lines: List[str] = []
+        self._partial_line = ""
+        self._in_code_block = False
+
+    def feed(self, chunk: str) -> None:
+        """Classify every line completed by this chunk"""
+        lines = (self._partial_line + chunk).split("\n")
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._add_line(line)
+
+    def finish(self) -> str:
+        """Classify the trailing line and return the cleaned code"""
+        self._add_line(self._partial_line)
+        self._partial_line = ""
+        return "\n".join(self.code_lines)
+
+    def _add_line(self, line: str) -> None:
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            self._in_code_block = not self._in_code_block
+            return
+        if self._in_code_block or (
+            stripped and not line.startswith(_EXPLANATION_PREFIXES)
+        ):
+            self.code_lines.append(line)
+
 
 def clean_generated_code(content: str) -> str:
     """Clean the generated code by removing markdown and explanatory text."""
-    lines = content.split("\n")
-    code_lines = []
-    in_code_block = False
-
-    for line in lines:
-        if line.strip().startswith("```"):
-            in_code_block = not in_code_block
-            continue
-        if in_code_block or (
-            line.strip()
-            and not line.startswith(("Here", "I ", "Note", "This", "The", "To"))
-        ):
-            code_lines.append(line)
+    cleaner = CodeCleaner()
+    cleaner.feed(content)
+    return cleaner.finish()
+
+
+def _execution_worker(conn: Connection) -> None:
+    """Worker loop: execute each snippet received over the pipe and report back
+
+    The FHIR tools and base namespace are created once per worker, so every
+    snippet shares the same client and its pooled connections.
+    """
+    fhir_client = FHIRClient()
+    base_namespace = {
+        "FHIRClient": FHIRClient,
+        "FHIRExplorer": FHIRExplorer,
+        "client": fhir_client,
+        "explorer": FHIRExplorer(fhir_client),
+        "print": console.print,
+    }
+    # Bytecode for snippets already seen; identical retries skip compilation
+    compiled: Dict[str, CodeType] = {}
+    conn.send((True, None))
+
+    while True:
+        code = conn.recv()
+        if code is None:
+            break
+
+        namespace = dict(base_namespace)
+        try:
+            code_obj = compiled.get(code)
+            if code_obj is None:
+                code_obj = compiled[code] = compile(code, "<generated>", "exec")
+            exec(code_obj, namespace)
+
+            if "main" in namespace:
+                namespace["main"]()
+
+            conn.send((True, None))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {str(e)}"))
+
+    fhir_client.close()
+
+
+# Workers are spawned rather than forked: a fork taken while the progress
+# display is live would inherit its render hook and possibly a held lock, so
+# each worker starts fresh with its own console
+_WORKER_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class CodeExecutionWorker:
+    """Persistent subprocess that executes generated code off the event loop
+
+    A snippet that exceeds the timeout, or takes the process down with it, is
+    killed and the worker respawned for the next attempt. Snippets that
+    already failed are not run again; their recorded error is returned.
+    """
+
+    def __init__(self, timeout: float = EXECUTION_TIMEOUT):
+        self.timeout = timeout
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.conn: Optional[Connection] = None
+        # Only one snippet runs in the worker at a time
+        self.lock = asyncio.Lock()
+        self.failures: Dict[str, str] = {}
+
+    def start(self):
+        """Spawn the worker and block until its FHIR tools are ready"""
+        parent_conn, child_conn = _WORKER_CONTEXT.Pipe()
+        self.process = _WORKER_CONTEXT.Process(
+            target=_execution_worker, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.conn.recv()
+
+    def stop(self):
+        """Ask the worker to exit, killing it if it does not"""
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.conn.close()
+        self.process = None
+
+    async def _restart(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        await asyncio.to_thread(self.start)
+
+    async def run(self, code: str) -> Tuple[bool, Optional[str]]:
+        """Execute code in the worker and return (success, error)"""
+        if code in self.failures:
+            return False, self.failures[code]
+
+        async with self.lock:
+            self.conn.send(code)
+            try:
+                success, error = await asyncio.wait_for(
+                    asyncio.to_thread(self.conn.recv), self.timeout
+                )
+            except asyncio.TimeoutError:
+                await self._restart()
+                success, error = (
+                    False,
+                    f"TimeoutError: execution exceeded {self.timeout}s",
+                )
+            except EOFError:
+                await self._restart()
+                success, error = (
+                    False,
+                    "WorkerError: execution process exited unexpectedly",
+                )
 
-    return "\n".join(code_lines)
+        if not success:
+            self.failures[code] = error
+        return success, error
 
 
 async def execute_generated_code(
-    code: str, context: dict
-) -> tuple[bool, Optional[str]]:
-    """Execute the generated code with proper context and capture any errors."""
-    try:
-        cleaned_code = clean_generated_code(code)
-
-        namespace = {
-            "FHIRClient": FHIRClient,
-            "FHIRExplorer": FHIRExplorer,
-            "client": context["client"],
-            "explorer": context["explorer"],
-            "print": console.print,
-        }
+    code: str, worker: CodeExecutionWorker
+) -> Tuple[bool, Optional[str]]:
+    """Execute cleaned generated code with proper context and capture any errors."""
+    return await worker.run(code)
 
-        exec(cleaned_code, namespace)
 
-        if "main" in namespace:
-            namespace["main"]()
+def show_generated_code(content: str, attempt: int) -> None:
+    """Print generated code, highlighting it only for an interactive terminal
 
-        return True, None
-    except Exception as e:
-        return False, f"{type(e).__name__}: {str(e)}"
+    Highlighting runs Pygments over the whole response, which is wasted work
+    when output goes to a log or pipe, so plain text is printed there.
+    """
+    title = f"Generated Code (Attempt {attempt})"
+    if not console.is_terminal:
+        console.print(title, content, sep="\n", markup=False, highlight=False)
+        return
+
+    code_syntax = Syntax(
+        content,
+        PYTHON_LEXER,
+        theme="monokai",
+        line_numbers=True,
+    )
+
+    console.print(Panel(code_syntax, title=title, border_style="green"))
+
+
+async def generate_code(
+    client: OllamaClient,
+    prompt: str,
+    system_prompt: str,
+    progress: Progress,
+    description: str = "Generating code...",
+) -> Tuple[str, str]:
+    """Stream a completion for the prompt, showing progress as tokens arrive
+
+    Returns the raw response and the code cleaned from it while streaming.
+    """
+    task_id = progress.add_task(description, total=None)
+    try:
+        chunks = []
+        cleaner = CodeCleaner()
+        async for chunk in client.generate_stream(
+            prompt=prompt,
+            system_prompt=system_prompt,
+            temperature=0.2,
+            max_tokens=1000,
+        ):
+            chunks.append(chunk)
+            cleaner.feed(chunk)
+            progress.update(
+                task_id, description=f"{description} ({len(chunks)} tokens)"
+            )
+        return "".join(chunks), cleaner.finish()
+    finally:
+        progress.remove_task(task_id)
 
 
 async def generate_and_test_code(
     client: OllamaClient,
     prompt: str,
     system_prompt: str,
-    context: dict,
+    worker: CodeExecutionWorker,
+    progress: Progress,
     max_attempts: int = 5,
     trainer: Optional[FHIRAgentTrainer] = None,
 ) -> None:
-    """Generate code and attempt to execute it, learning from failures"""
+    """Generate code and attempt to execute it, learning from failures
+
+    Each retry prompt includes the previous attempt's execution error, so
+    the next attempt cannot be generated until execution finishes.
+    """
 
     last_error = None
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        TimeElapsedColumn(),
-        console=console,
-        transient=True,
-    ) as progress:
-        for attempt in range(max_attempts):
-            console.print(
-                f"\n[bold cyan]Attempt {attempt + 1}/{max_attempts}[/bold cyan]"
+    for attempt in range(max_attempts):
+        console.print(f"\n[bold cyan]Attempt {attempt + 1}/{max_attempts}[/bold cyan]")
+
+        try:
+            task_prompt = (
+                trainer.get_enhanced_prompt(prompt, last_error) if trainer else prompt
+            )
+            content, code = await generate_code(
+                client, task_prompt, system_prompt, progress
             )
 
-            try:
-                task_id = progress.add_task("Generating code...", total=None)
-                response = await client.generate(
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    temperature=0.2,
-                    max_tokens=1000,
-                )
-                progress.remove_task(task_id)
+            show_generated_code(content, attempt + 1)
 
-                code_syntax = Syntax(
-                    response.content,
-                    "python",
-                    theme="monokai",
-                    line_numbers=True,
-                )
+            task_id = progress.add_task("Executing code...", total=None)
+            success, error = await execute_generated_code(code, worker)
+            progress.remove_task(task_id)
 
-                console.print(
-                    Panel(
-                        code_syntax,
-                        title=f"Generated Code (Attempt {attempt + 1})",
-                        border_style="green",
-                    )
+            if trainer:
+                trainer.record_attempt(
+                    task=prompt, code=content, success=success, error=error
                 )
 
-                task_id = progress.add_task("Executing code...", total=None)
-                success, error = await execute_generated_code(response.content, context)
-                progress.remove_task(task_id)
-
-                if trainer:
-                    trainer.record_attempt(
-                        task=prompt, code=response.content, success=success, error=error
-                    )
-
-                if success:
-                    console.print(
-                        "[bold green]✅ Code executed successfully![/bold green]"
-                    )
-                    return
-                else:
-                    console.print(f"[bold red]❌ Execution failed:[/bold red] {error}")
-                    last_error = error
+            if success:
+                console.print("[bold green]✅ Code executed successfully![/bold green]")
+                return
+            else:
+                console.print(f"[bold red]❌ Execution failed:[/bold red] {error}")
+                last_error = error
 
-            except Exception as e:
-                console.print(f"[bold red]Error during generation:[/bold red] {str(e)}")
-                last_error = str(e)
+        except Exception as e:
+            console.print(f"[bold red]Error during generation:[/bold red] {str(e)}")
+            last_error = str(e)
 
-            if attempt < max_attempts - 1:
-                console.print("\n[yellow]Retrying with error context...[/yellow]")
-            else:
-                console.print("\n[red]Max attempts reached. Task failed.[/red]")
+        if attempt < max_attempts - 1:
+            console.print("\n[yellow]Retrying with error context...[/yellow]")
+        else:
+            console.print("\n[red]Max attempts reached. Task failed.[/red]")
 
 
 async def main():
@@ -226,57 +655,68 @@ async def main():
     console.print("[bold green]Starting FHIR Agent Training Session[/bold green]")
     console.print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        TimeElapsedColumn(),
-        console=console,
-        transient=True,
-    ) as progress:
-        task_id = progress.add_task("Initializing FHIR tools...", total=None)
-        fhir_client = FHIRClient()
-        fhir_explorer = FHIRExplorer()
-        progress.remove_task(task_id)
-
-    context = {"client": fhir_client, "explorer": fhir_explorer}
-
-    system_prompt = """You are a Python expert specializing in healthcare data integration.
-Your task is to write executable Python code that uses the provided client instance.
-
-IMPORTANT:
-1. The client instance is already provided as 'client'
-2. Return ONLY valid Python code
-3. Do not create new client instances
-4. Include proper error handling
-5. Use the rich library for output formatting
-
-Example of valid code structure:
-def main():
-    '''Function to demonstrate FHIR client usage'''
+    worker = CodeExecutionWorker()
     try:
-        patient = client.get_patient('example')
-        print(f"Patient data: {patient}")
-    except Exception as e:
-        print(f"Error: {e}")
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
 
-if __name__ == "__main__":
-    main()"""
+        # Every Ollama request in this run goes through the shared connection
+        # pool, which is closed once all tasks finish
+        async with OllamaClient() as ollama_client:
+            with Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                TimeElapsedColumn(),
+                console=console,
+                transient=True,
+            ) as progress:
+                # Spawning the worker and loading the model are independent, so
+                # overlap them
+                task_id = progress.add_task(
+                    "Initializing FHIR tools and warming prompt cache...", total=None
+                )
+                _, preloaded = await asyncio.gather(
+                    asyncio.to_thread(worker.start),
+                    ollama_client.preload(SYSTEM_PROMPT),
+                )
+                progress.remove_task(task_id)
+                if not preloaded:
+                    console.print(
+                        "[yellow]Could not preload the model; the first attempt "
+                        "will load it instead[/yellow]"
+                    )
 
-    prompt = "Write a program that retrieves a patient with ID 'example' using the provided client instance and prints their name and birth date. Handle any potential errors."
+                async def run_task(prompt: str) -> None:
+                    async with semaphore:
+                        await generate_and_test_code(
+                            client=ollama_client,
+                            prompt=prompt,
+                            system_prompt=SYSTEM_PROMPT,
+                            worker=worker,
+                            progress=progress,
+                            max_attempts=5,
+                            trainer=trainer,
+                        )
+
+                results = await asyncio.gather(
+                    *(run_task(prompt) for prompt in TASKS),
+                    return_exceptions=True,
+                )
 
-    try:
-        async with OllamaClient() as ollama_client:
-            await generate_and_test_code(
-                client=ollama_client,
-                prompt=prompt,
-                system_prompt=system_prompt,
-                context=context,
-                max_attempts=5,
-                trainer=trainer,
-            )
+        for prompt, result in zip(TASKS, results):
+            if isinstance(result, Exception):
+                console.print(f"[bold red]Task failed:[/bold red] {prompt}\n{result}")
     finally:
+        await close_shared_client()
+        worker.stop()
         trainer.save_training_session()
 
 
 if __name__ == "__main__":
+    # uvloop is optional; the default loop is used when it isn't installed
+    try:
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     asyncio.run(main())
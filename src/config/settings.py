@@ -1,8 +1,17 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from pydantic import ConfigDict
 
 
 class Settings(BaseSettings):
     FHIR_SERVER_URL: str = "https://hapi.fhir.org/baseR4"
+    # Generate calls allowed in flight at once; match the GPU's effective batch
+    OLLAMA_MAX_INFLIGHT: int = 4
 
     model_config = ConfigDict(env_file=".env")
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings, reading the environment only once"""
+    return Settings()
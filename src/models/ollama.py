@@ -1,7 +1,80 @@
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, Optional
+import asyncio
+import weakref
 import httpx
 from pydantic import BaseModel
-import json
+import orjson
+import time
+from src.config.settings import get_settings
+
+# Connections are pooled in one client shared by every OllamaClient. Idle
+# connections are kept well past httpx's 5 s default so they survive the
+# gaps between attempts while generated code runs.
+HTTP_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=50, keepalive_expiry=300
+)
+
+# Without streaming Ollama sends nothing until generation finishes, and loading
+# a model can take a while, so reads wait indefinitely; connecting and writing
+# keep httpx's 5 s default
+HTTP_TIMEOUT = httpx.Timeout(5.0, read=None)
+
+# Request bodies are serialized with orjson and sent as raw content
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Minimal user prompt sent by preload so the system prompt is evaluated
+PRELOAD_PROMPT = "."
+
+# Seconds a successful health check is trusted before asking the server again
+HEALTH_CHECK_TTL = 30.0
+# Failures are cached briefly too, so repeated checks against a server that is
+# down don't each wait on a connection attempt
+HEALTH_CHECK_FAILURE_TTL = 5.0
+
+# An AsyncClient's pool is tied to the event loop that opened it, so the shared
+# client is kept per loop and dropped along with it
+_shared_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+# Generate calls in flight per event loop, shared by every OllamaClient;
+# overshooting the model's batch size only adds queueing on the GPU
+_inflight_semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_shared_client() -> httpx.AsyncClient:
+    """Return the pooled HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        _shared_clients[loop] = client
+    return client
+
+
+async def close_shared_client() -> None:
+    """Close the running loop's pooled HTTP client, if one was opened"""
+    client = _shared_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _inflight_semaphore() -> asyncio.Semaphore:
+    """Return the running loop's generate semaphore, sized from settings"""
+    loop = asyncio.get_running_loop()
+    semaphore = _inflight_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(get_settings().OLLAMA_MAX_INFLIGHT)
+        _inflight_semaphores[loop] = semaphore
+    return semaphore
+
+
+def _decode_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """Decode one NDJSON line, skipping blank or malformed ones"""
+    if not line.strip():
+        return None
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError:
+        return None
 
 
 class ModelResponse(BaseModel):
@@ -21,69 +94,203 @@ class ModelServiceError(Exception):
 class OllamaClient:
     """Client for interacting with locally running Ollama instance"""
 
-    def __init__(self):
+    def __init__(
+        self, keep_alive: str = "30m", client: Optional[httpx.AsyncClient] = None
+    ):
         self.base_url = "http://localhost:11434"
         self.model = "deepseek-coder"
-        self.client = httpx.AsyncClient()
+        # Keep the model (and its prompt KV cache) resident between calls so
+        # requests sharing a system prompt skip re-evaluating that prefix
+        self.keep_alive = keep_alive
+        # Without an injected client, the loop's shared pool is used
+        self._client = client
+        # (expiry, result) of the last health check
+        self._health = (0.0, False)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_shared_client()
+
+    @classmethod
+    def set_max_inflight(cls, limit: int) -> None:
+        """Change how many generate calls may run at once on this event loop
+
+        Calls already in flight finish under the previous limit.
+        """
+        _inflight_semaphores[asyncio.get_running_loop()] = asyncio.Semaphore(limit)
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.client.aclose()
+        # The connection pool outlives this client; see close_shared_client
+        pass
 
     async def health_check(self) -> bool:
-        """Check if Ollama service is healthy"""
+        """Check if Ollama service is healthy, reusing a recent result"""
+        now = time.monotonic()
+        expires, healthy = self._health
+        if now < expires:
+            return healthy
+
         try:
             response = await self.client.get(f"{self.base_url}/api/tags")
+            healthy = response.status_code == 200
+        except httpx.RequestError:
+            healthy = False
+
+        ttl = HEALTH_CHECK_TTL if healthy else HEALTH_CHECK_FAILURE_TTL
+        self._health = (now + ttl, healthy)
+        return healthy
+
+    async def preload(self, system_prompt: Optional[str] = None) -> bool:
+        """Load the model and evaluate a shared system prompt ahead of use
+
+        Later requests that start with the same system prompt reuse the
+        cached prefix instead of evaluating it again.
+        """
+        # An empty prompt only loads the model; any prompt makes Ollama render
+        # and evaluate the system prompt ahead of it
+        payload = self._build_payload(PRELOAD_PROMPT, system_prompt, 0.0, 1, None)
+        payload["stream"] = False
+        try:
+            async with _inflight_semaphore():
+                # Loading the model on a cold start takes longer than any
+                # short read timeout an injected client may have
+                response = await self.client.post(
+                    f"{self.base_url}/api/generate",
+                    content=orjson.dumps(payload),
+                    headers=JSON_HEADERS,
+                    timeout=HTTP_TIMEOUT,
+                )
             return response.status_code == 200
         except httpx.RequestError:
             return False
 
-    async def generate(
+    def _build_payload(
         self,
         prompt: str,
-        system_prompt: Optional[str] = None,
-        temperature: float = 0.7,
-        max_tokens: int = 2000,
-    ) -> ModelResponse:
-        """Generate text using the Ollama model"""
-        payload = {
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int],
+    ) -> Dict[str, Any]:
+        """Build the request body for the generate endpoint"""
+        options = {"temperature": temperature, "num_predict": max_tokens}
+        if num_ctx:
+            options["num_ctx"] = num_ctx
+
+        return {
             "model": self.model,
             "prompt": prompt,
             "system": system_prompt if system_prompt else "",
-            "temperature": temperature,
-            "max_tokens": max_tokens,
+            "options": options,
+            "keep_alive": self.keep_alive,
         }
 
+    async def _stream_generate(
+        self, payload: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield each decoded NDJSON chunk of a streaming generate call
+
+        Lines are parsed as they arrive, straight from the raw bytes, so the
+        response is never buffered whole or decoded to str.
+        """
+        payload["stream"] = True
+
         try:
-            response = await self.client.post(
-                f"{self.base_url}/api/generate", json=payload
-            )
+            async with _inflight_semaphore(), self.client.stream(
+                "POST",
+                f"{self.base_url}/api/generate",
+                content=orjson.dumps(payload),
+                headers=JSON_HEADERS,
+            ) as response:
+                response.raise_for_status()
+                pending = b""
+                async for raw in response.aiter_bytes():
+                    *lines, pending = (pending + raw).split(b"\n")
+                    for line in lines:
+                        data = _decode_line(line)
+                        if data is not None:
+                            yield data
+                data = _decode_line(pending)
+                if data is not None:
+                    yield data
+        except httpx.RequestError as e:
+            raise ModelServiceError(f"Failed to generate: {str(e) or type(e).__name__}")
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        num_ctx: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        """Yield generated text chunks as the Ollama model produces them"""
+        payload = self._build_payload(
+            prompt, system_prompt, temperature, max_tokens, num_ctx
+        )
+
+        async for data in self._stream_generate(payload):
+            chunk = data.get("response", "")
+            if chunk:
+                yield chunk
+
+    async def _post_generate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Make a non-streaming generate call and decode its single JSON reply"""
+        payload["stream"] = False
+
+        try:
+            async with _inflight_semaphore():
+                response = await self.client.post(
+                    f"{self.base_url}/api/generate",
+                    content=orjson.dumps(payload),
+                    headers=JSON_HEADERS,
+                )
             response.raise_for_status()
+            return orjson.loads(response.content)
+        except httpx.RequestError as e:
+            raise ModelServiceError(f"Failed to generate: {str(e) or type(e).__name__}")
 
-            # Handle streaming response - accumulate all chunks
-            full_response = ""
+    async def generate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        num_ctx: Optional[int] = None,
+        stream: bool = False,
+    ) -> ModelResponse:
+        """Generate text using the Ollama model
+
+        The reply arrives as one JSON object unless stream is set; use
+        generate_stream to consume tokens as they are produced.
+        """
+        payload = self._build_payload(
+            prompt, system_prompt, temperature, max_tokens, num_ctx
+        )
+
+        if stream:
+            # Accumulate streamed chunks, keeping the last one for its metadata
+            full_response = []
             last_data = None
 
-            for line in response.content.decode().split("\n"):
-                if not line.strip():
-                    continue
-                try:
-                    data = json.loads(line)
-                    full_response += data.get("response", "")
-                    last_data = data
-                except json.JSONDecodeError:
-                    continue
-
-            return ModelResponse(
-                content=full_response,
-                metadata={
-                    "model": self.model,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                },
-                raw_response=last_data or {},  # Store the last chunk for metadata
-            )
-        except httpx.RequestError as e:
-            raise ModelServiceError(f"Failed to generate: {str(e)}")
+            async for data in self._stream_generate(payload):
+                full_response.append(data.get("response", ""))
+                last_data = data
+            content = "".join(full_response)
+        else:
+            last_data = await self._post_generate(payload)
+            content = last_data.get("response", "")
+
+        # Fields are built here from the decoded reply, so skip validation
+        return ModelResponse.model_construct(
+            content=content,
+            metadata={
+                "model": self.model,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+            raw_response=last_data or {},  # Store the last chunk for metadata
+        )
@@ -1,23 +1,228 @@
-from src.config.settings import Settings
+import asyncio
+import weakref
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import httpx
+import ijson
+import orjson
+from src.config.settings import get_settings
 from fhirclient import client
-from fhirclient.models import patient
+
+# Reads are served over a pooled keep-alive connection instead of going through
+# the fhirclient SDK, which is much slower for plain reads by ID
+FHIR_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=16)
+FHIR_HEADERS = {"Accept": "application/fhir+json"}
+
+# Upper bound on concurrent searches issued by a single batch
+FHIR_MAX_CONCURRENCY = 8
+
+# IDs coalesced into one Patient?_id= search; keeps the query string short
+FHIR_SEARCH_BATCH = 50
+
+# Seconds single reads wait for others to share their search request
+FHIR_BATCH_WINDOW = 0.02
+
+
+@lru_cache(maxsize=None)
+def get_http_client(base_url: str) -> httpx.Client:
+    """Return the process-wide HTTP/2 client for a FHIR server"""
+    return httpx.Client(
+        base_url=base_url,
+        http2=True,
+        headers=FHIR_HEADERS,
+        limits=FHIR_HTTP_LIMITS,
+    )
+
+
+# Async clients are bound to the event loop that opened them, so the shared
+# ones are kept per loop (and per server) and dropped along with the loop
+_async_http_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client(base_url: str) -> httpx.AsyncClient:
+    """Return the running loop's shared HTTP/2 async client for a FHIR server"""
+    clients = _async_http_clients.setdefault(asyncio.get_running_loop(), {})
+    http = clients.get(base_url)
+    if http is None or http.is_closed:
+        http = httpx.AsyncClient(
+            base_url=base_url,
+            http2=True,
+            headers=FHIR_HEADERS,
+            limits=FHIR_HTTP_LIMITS,
+        )
+        clients[base_url] = http
+    return http
+
+
+async def close_async_http_clients() -> None:
+    """Close the running loop's shared async FHIR clients, if any were opened"""
+    clients = _async_http_clients.pop(asyncio.get_running_loop(), {})
+    for http in clients.values():
+        await http.aclose()
+
+
+class _ResponseReader:
+    """Async file-like view of a streamed response body, as ijson reads it"""
+
+    def __init__(self, response: httpx.Response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        # ijson probes with read(0) to detect bytes; that must not use up data
+        if size == 0:
+            return b""
+        # Chunks are handed over whole; an empty read marks the end of the body
+        async for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+
+class _WindowBatcher:
+    """Coalesces single reads issued within a short window into one batch
+
+    The first read in a window starts a timer; every ID submitted before it
+    fires (or before the batch fills) is fetched with a single call.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[str]], Awaitable[List[Optional[Dict]]]],
+        window: float = FHIR_BATCH_WINDOW,
+        max_batch: int = FHIR_SEARCH_BATCH,
+    ):
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, resource_id: str) -> Optional[Dict]:
+        """Queue one ID for the current window and wait for its resource"""
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(resource_id)
+        if future is None:
+            future = loop.create_future()
+            self._pending[resource_id] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        # Shielded so one cancelled caller doesn't fail others awaiting the ID
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._resolve(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, batch: Dict[str, asyncio.Future]) -> None:
+        try:
+            results = await self.fetch(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(batch.values(), results):
+            if not future.done():
+                future.set_result(result)
 
 
 class FHIRClient:
-    def __init__(self):
-        self.settings = Settings()
+    def __init__(
+        self,
+        http: Optional[httpx.Client] = None,
+        async_http: Optional[httpx.AsyncClient] = None,
+    ):
+        self.settings = get_settings()
+        # The SDK client is kept for code paths that need SMART auth
         self.smart = client.FHIRClient(
             settings={
                 "app_id": "ehr_adaptive_agent",
                 "api_base": self.settings.FHIR_SERVER_URL,
             }
         )
+        self.http = http or get_http_client(self.settings.FHIR_SERVER_URL)
+        self.async_http = async_http
+        self._batcher = _WindowBatcher(self.get_patients)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the SDK's HTTP session; the shared read pool stays open"""
+        self.smart.server.session.close()
 
     def get_patient(self, patient_id: str):
         """Fetch a patient resource by ID"""
         try:
-            search = patient.Patient.read(patient_id, self.smart.server)
-            return search.as_json()
-        except Exception as e:
+            response = self.http.get(f"Patient/{patient_id}")
+            response.raise_for_status()
+            return orjson.loads(response.content)
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
             print(f"Error fetching patient: {e}")
             return None
+
+    async def read_patient(self, patient_id: str) -> Optional[Dict]:
+        """Fetch a patient resource by ID, sharing a search with concurrent reads"""
+        return await self._batcher.submit(patient_id)
+
+    async def get_patients(self, patient_ids: List[str]) -> List[Optional[Dict]]:
+        """Fetch several patient resources in as few requests as possible
+
+        Patients that cannot be fetched come back as None, as in get_patient.
+        """
+        # Searches share the loop's pooled client; over HTTP/2 a batch's
+        # searches are multiplexed on one connection
+        http = self.async_http or get_async_http_client(self.settings.FHIR_SERVER_URL)
+        return await self._gather_patients(http, patient_ids)
+
+    async def _gather_patients(
+        self, http: httpx.AsyncClient, patient_ids: List[str]
+    ) -> List[Optional[Dict]]:
+        # Reads are coalesced into Patient?_id=a,b,c searches and the returned
+        # Bundle entries are matched back to the requested IDs
+        unique_ids = list(dict.fromkeys(patient_ids))
+        chunks = [
+            unique_ids[i : i + FHIR_SEARCH_BATCH]
+            for i in range(0, len(unique_ids), FHIR_SEARCH_BATCH)
+        ]
+        semaphore = asyncio.Semaphore(FHIR_MAX_CONCURRENCY)
+
+        async def search(chunk: List[str]) -> Dict[str, Dict]:
+            found = {}
+            async with semaphore:
+                try:
+                    async with http.stream(
+                        "GET",
+                        "Patient",
+                        params={"_id": ",".join(chunk), "_count": len(chunk)},
+                    ) as response:
+                        response.raise_for_status()
+                        # Entries are parsed one at a time as the Bundle arrives
+                        async for resource in ijson.items(
+                            _ResponseReader(response),
+                            "entry.item.resource",
+                            use_float=True,
+                        ):
+                            if resource.get("resourceType") == "Patient":
+                                found[resource.get("id")] = resource
+                except (httpx.HTTPError, ijson.JSONError) as e:
+                    print(f"Error fetching patients {', '.join(chunk)}: {e}")
+                    return {}
+            return found
+
+        patients = {}
+        for found in await asyncio.gather(*(search(chunk) for chunk in chunks)):
+            patients.update(found)
+        return [patients.get(patient_id) for patient_id in patient_ids]
@@ -1,12 +1,72 @@
-from typing import Dict, List, Optional
-from fhirclient import client
+import asyncio
+import importlib
+import sys
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import httpx
+import orjson
 from .client import FHIRClient
-from fhirclient.models import patient
+
+# Patient fields holding references, paired with the resource type they point to
+_PATIENT_REF_FIELDS = (
+    ("managingOrganization", "Organization"),
+    ("generalPractitioner", "Practitioner"),
+)
+
+# Kinds of entries on the _find_references stack
+_NODE = 0
+_REF = 1
+
+
+@lru_cache(maxsize=32)
+def _fetch_sample(http: httpx.Client, resource_type: str) -> bytes:
+    """Fetch a server's example resource once, keyed by its pooled client
+
+    The raw body is cached so every caller decodes its own copy.
+    """
+    response = http.get(f"{resource_type}/example")
+    response.raise_for_status()
+    return response.content
+
+
+@lru_cache(maxsize=32)
+def _model_fields(resource_type: str) -> Tuple[str, ...]:
+    """List a resource type's fields from fhirclient's bundled R4 models"""
+    module = importlib.import_module(f"fhirclient.models.{resource_type.lower()}")
+    model = getattr(module, resource_type)
+    return tuple(prop[1] for prop in model().elementProperties())
+
+
+def _describe_object(value: Dict, stack: List) -> Dict:
+    properties = {}
+    stack.append((value, properties))
+    return {"type": "object", "properties": properties}
+
+
+def _describe_array(value: List, stack: List) -> Dict:
+    # Arrays are described by their first item
+    if not value:
+        items = {}
+    elif type(value[0]) is dict:
+        items = {}
+        stack.append((value[0], items))
+    else:
+        items = {"type": type(value[0]).__name__}
+    return {"type": "array", "items": items}
+
+
+def _describe_scalar(value, stack: List) -> Dict:
+    return {"type": type(value).__name__}
+
+
+# Structure descriptions dispatched on a value's exact JSON type
+_STRUCTURE_HANDLERS = {dict: _describe_object, list: _describe_array}
 
 
 class FHIRExplorer:
-    def __init__(self):
-        self.client = FHIRClient()
+    def __init__(self, client: Optional[FHIRClient] = None):
+        # Share the caller's client (and its connection pool) when given one
+        self.client = client or FHIRClient()
         self.resource_types = [
             "Patient",
             "Observation",
@@ -15,48 +75,43 @@ class FHIRExplorer:
             "MedicationRequest",
         ]
 
-    async def explore_resource_structure(self, resource_type: str) -> Dict:
-        """Explore the structure of a FHIR resource type"""
+    async def explore_resource_structure(
+        self, resource_type: str, include_sample: bool = False
+    ) -> Dict:
+        """Explore the structure of a FHIR resource type
+
+        Fields come from the bundled resource definitions; the server is only
+        asked for its example resource when include_sample is set.
+        """
         try:
-            if resource_type == "Patient":
-                # Get a sample patient to explore structure
-                sample = patient.Patient.read("example", self.client.smart.server)
+            if resource_type in self.resource_types:
                 structure = {
-                    "resourceType": "Patient",
-                    "fields": list(sample.as_json().keys()),
-                    "sample": sample.as_json(),
+                    "resourceType": resource_type,
+                    "fields": list(_model_fields(resource_type)),
                 }
+                if include_sample:
+                    content = await asyncio.to_thread(
+                        _fetch_sample, self.client.http, resource_type
+                    )
+                    structure["sample"] = orjson.loads(content)
                 return {"structure": structure}
             return {"error": f"Resource type {resource_type} not yet supported"}
         except Exception as e:
             return {"error": f"Error exploring {resource_type}: {str(e)}"}
 
     def _analyze_structure(self, resource: Dict) -> Dict:
-        """Recursively analyzes the structure of a FHIR resource"""
+        """Analyzes the structure of a FHIR resource, walking nested values"""
         structure = {}
+        # Each entry pairs a source object with the dict describing it
+        stack = [(resource, structure)]
 
-        for key, value in resource.items():
-            if isinstance(value, dict):
-                structure[key] = {
-                    "type": "object",
-                    "properties": self._analyze_structure(value),
-                }
-            elif isinstance(value, list):
-                if value:
-                    if isinstance(value[0], dict):
-                        structure[key] = {
-                            "type": "array",
-                            "items": self._analyze_structure(value[0]),
-                        }
-                    else:
-                        structure[key] = {
-                            "type": "array",
-                            "items": {"type": type(value[0]).__name__},
-                        }
-                else:
-                    structure[key] = {"type": "array", "items": {}}
-            else:
-                structure[key] = {"type": type(value).__name__}
+        while stack:
+            node, target = stack.pop()
+            for key, value in node.items():
+                # FHIR uses a small fixed vocabulary of field names
+                target[sys.intern(key)] = _STRUCTURE_HANDLERS.get(
+                    type(value), _describe_scalar
+                )(value, stack)
 
         return structure
 
@@ -64,49 +119,70 @@ class FHIRExplorer:
         self, resource_id: str, resource_type: str
     ) -> Dict:
         """Get relationships for a specific resource"""
-        try:
-            if resource_type == "Patient":
-                # Get the patient resource
-                pat = patient.Patient.read(resource_id, self.client.smart.server)
-                pat_json = pat.as_json()
-
-                # Extract references from the patient resource
-                references = []
-                # Look for common reference fields in Patient resource
-                if "managingOrganization" in pat_json:
-                    references.append(
-                        {
-                            "type": "Organization",
-                            "field": "managingOrganization",
-                            "reference": pat_json["managingOrganization"],
-                        }
-                    )
-                if "generalPractitioner" in pat_json:
-                    references.append(
-                        {
-                            "type": "Practitioner",
-                            "field": "generalPractitioner",
-                            "reference": pat_json["generalPractitioner"],
-                        }
-                    )
+        if resource_type == "Patient":
+            # Concurrent callers' reads are coalesced into one search
+            try:
+                pat_json = await self.client.read_patient(resource_id)
+            except Exception as e:
+                return {"error": f"Error exploring relationships: {str(e)}"}
+            return self._relationships(resource_id, pat_json)
+        return {"error": f"Resource type {resource_type} not yet supported"}
 
-                return {"references": references}
-            return {"error": f"Resource type {resource_type} not yet supported"}
+    async def get_patient_relationships(
+        self, patient_ids: List[str]
+    ) -> Dict[str, Dict]:
+        """Get relationships for several patients, fetched in one batch"""
+        try:
+            patients = await self.client.get_patients(patient_ids)
         except Exception as e:
-            return {"error": f"Error exploring relationships: {str(e)}"}
+            error = {"error": f"Error exploring relationships: {str(e)}"}
+            return {patient_id: error for patient_id in patient_ids}
+
+        return {
+            patient_id: self._relationships(patient_id, pat_json)
+            for patient_id, pat_json in zip(patient_ids, patients)
+        }
+
+    def _relationships(self, patient_id: str, pat_json: Optional[Dict]) -> Dict:
+        """Build the relationships result for one fetched patient"""
+        if pat_json is None:
+            return {
+                "error": f"Error exploring relationships: "
+                f"Patient {patient_id} could not be fetched"
+            }
+        return {"references": self._patient_references(pat_json)}
+
+    def _patient_references(self, pat_json: Dict) -> List[Dict]:
+        """Extract references from the patient resource"""
+        references = []
+        # Look up each known reference field in Patient resource once
+        for field, ref_type in _PATIENT_REF_FIELDS:
+            value = pat_json.get(field)
+            if value is not None:
+                references.append(
+                    {"type": ref_type, "field": field, "reference": value}
+                )
+        return references
 
     def _find_references(
         self, data: Dict, references: List[str], path: str = ""
     ) -> None:
-        """Recursively finds all references in a FHIR resource"""
-        if isinstance(data, dict):
-            for key, value in data.items():
-                new_path = f"{path}.{key}" if path else key
-
-                if key == "reference" and isinstance(value, str):
-                    references.append({"path": path, "reference": value})
-                elif isinstance(value, (dict, list)):
-                    self._find_references(value, references, new_path)
-        elif isinstance(data, list):
-            for item in data:
-                self._find_references(item, references, path)
+        """Finds all references in a FHIR resource, in document order"""
+        # Paths are kept as tuples and only joined for the references found
+        stack = [(_NODE, data, tuple(path.split(".")) if path else ())]
+
+        while stack:
+            kind, value, node_path = stack.pop()
+            if kind == _REF:
+                # Queued as it was found, so it is reported in document order
+                references.append({"path": ".".join(node_path), "reference": value})
+            elif type(value) is dict:
+                # Pushed in reverse so entries are visited in their original order
+                for key, child in reversed(value.items()):
+                    if key == "reference" and type(child) is str:
+                        stack.append((_REF, child, node_path))
+                    elif type(child) is dict or type(child) is list:
+                        stack.append((_NODE, child, node_path + (key,)))
+            elif type(value) is list:
+                for item in reversed(value):
+                    stack.append((_NODE, item, node_path))
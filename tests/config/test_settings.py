@@ -0,0 +1,7 @@
+from src.config.settings import Settings, get_settings
+
+
+def test_get_settings_returns_singleton():
+    settings = get_settings()
+    assert isinstance(settings, Settings)
+    assert get_settings() is settings
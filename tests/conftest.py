@@ -0,0 +1,15 @@
+import asyncio
+import pytest
+
+try:
+    import uvloop
+except ImportError:  # optional; async tests fall back to the default loop
+    uvloop = None
+
+
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    """Run async tests on uvloop when it is installed"""
+    if uvloop is None:
+        return asyncio.DefaultEventLoopPolicy()
+    return uvloop.EventLoopPolicy()
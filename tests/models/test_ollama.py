@@ -1,15 +1,18 @@
+import asyncio
+import json
 import pytest
 import httpx
-from src.models.ollama import OllamaClient, ModelServiceError
+from src.models.ollama import OllamaClient, ModelServiceError, close_shared_client
 import pytest_asyncio
 from typing import AsyncGenerator
 
 
 @pytest_asyncio.fixture
 async def ollama_client() -> AsyncGenerator[OllamaClient, None]:
-    client = OllamaClient()
-    yield client
-    await client.client.aclose()
+    async with OllamaClient() as client:
+        yield client
+    # The client borrows the loop's shared pool; close it with the test's loop
+    await close_shared_client()
 
 
 @pytest.mark.asyncio
@@ -50,3 +53,156 @@ async def test_generate_with_parameters(ollama_client):
 
     assert isinstance(response.content, str)
     assert len(response.content) > 0
+
+
+@pytest_asyncio.fixture
+async def streaming_client() -> AsyncGenerator[OllamaClient, None]:
+    """Client whose transport replays a canned NDJSON stream"""
+    lines = [
+        {"response": "def ", "done": False},
+        {"response": "main():", "done": False},
+        {"response": "", "done": True},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines).encode()
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    async with httpx.AsyncClient(transport=transport) as http_client:
+        yield OllamaClient(client=http_client)
+
+
+@pytest.mark.asyncio
+async def test_generate_stream_yields_chunks(streaming_client):
+    """Test streamed generation yields each non-empty chunk in order"""
+    chunks = [chunk async for chunk in streaming_client.generate_stream("prompt")]
+
+    assert chunks == ["def ", "main():"]
+
+
+@pytest.mark.asyncio
+async def test_health_check_reuses_healthy_result():
+    """Test a healthy result is cached instead of re-requesting /api/tags"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"models": []})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+        client = OllamaClient(client=http_client)
+
+        assert await client.health_check()
+        assert await client.health_check()
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_clients_share_connection_pool():
+    """Test clients on the same event loop reuse one pooled HTTP client"""
+    first, second = OllamaClient(), OllamaClient()
+
+    shared = first.client
+    assert second.client is shared
+
+    await close_shared_client()
+    assert shared.is_closed
+    assert not first.client.is_closed
+    await close_shared_client()
+
+
+@pytest.mark.asyncio
+async def test_generate_joins_streamed_chunks(streaming_client):
+    """Test generate joins the stream and keeps the final chunk as raw response"""
+    response = await streaming_client.generate("prompt", stream=True)
+
+    assert response.content == "def main():"
+    assert response.raw_response["done"] is True
+
+
+@pytest.mark.asyncio
+async def test_generate_calls_respect_inflight_limit():
+    """Test concurrent generate calls never exceed the in-flight limit"""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, content=b'{"response": "ok", "done": true}')
+
+    OllamaClient.set_max_inflight(2)
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+        client = OllamaClient(client=http_client)
+        responses = await asyncio.gather(*(client.generate("prompt") for _ in range(5)))
+
+    assert [response.content for response in responses] == ["ok"] * 5
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_sends_json_body():
+    """Test the payload is sent as a JSON body with its content type"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, content=b'{"response": "ok", "done": true}')
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+        await OllamaClient(client=http_client).generate("prompt", system_prompt="sys")
+
+    assert requests[0].headers["Content-Type"] == "application/json"
+    payload = json.loads(requests[0].content)
+    assert payload["stream"] is False
+    assert payload["prompt"] == "prompt"
+    assert payload["system"] == "sys"
+
+
+@pytest.mark.asyncio
+async def test_health_check_caches_failure_briefly():
+    """Test an unhealthy result is reused until its shorter TTL expires"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(503)
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+        client = OllamaClient(client=http_client)
+
+        assert not await client.health_check()
+        assert not await client.health_check()
+        assert len(requests) == 1
+
+        client._health = (0.0, False)
+        assert not await client.health_check()
+    assert len(requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_client_waits_for_slow_generations():
+    """Test the shared client doesn't time out reads of non-streamed replies"""
+    timeout = OllamaClient().client.timeout
+
+    assert timeout.read is None
+    assert timeout.connect == 5.0
+    await close_shared_client()
+
+
+@pytest.mark.asyncio
+async def test_preload_waits_for_model_load():
+    """Test preload overrides a short client timeout for the slow cold load"""
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"])
+        return httpx.Response(200, json={"done": True})
+
+    async with httpx.AsyncClient(
+        transport=httpx.MockTransport(handler), timeout=1.0
+    ) as http_client:
+        assert await OllamaClient(client=http_client).preload("sys")
+
+    assert timeouts[0]["read"] is None
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import pytest
+import pytest_asyncio
+from scripts.train_fhir_agent import (
+    CodeCleaner,
+    CodeExecutionWorker,
+    FHIRAgentTrainer,
+    clean_generated_code,
+)
+
+LEGACY = {
+    "task_history": [
+        {
+            "timestamp": "2024-01-01T00:00:00",
+            "task": "fetch patient",
+            "code": "old",
+            "success": True,
+            "error": None,
+        },
+        {
+            "timestamp": "2024-01-01T00:00:01",
+            "task": "fetch patient",
+            "code": "broken",
+            "success": False,
+            "error": "KeyError: 'name'",
+        },
+    ],
+    "successful_patterns": {"fetch patient": "old"},
+    "error_solutions": {"KeyError": "old"},
+}
+
+
+@pytest.fixture
+def history_dir(tmp_path, monkeypatch):
+    """Run the trainer in a scratch directory holding a legacy history file"""
+    monkeypatch.chdir(tmp_path)
+    history_dir = tmp_path / "training_history"
+    history_dir.mkdir()
+    (history_dir / "training_history.json").write_text(json.dumps(LEGACY))
+    return history_dir
+
+
+def load_trainer() -> FHIRAgentTrainer:
+    trainer = FHIRAgentTrainer()
+    trainer.history_log.close()
+    return trainer
+
+
+def read_log(history_dir):
+    lines = (history_dir / "training_history.jsonl").read_bytes().splitlines()
+    return [json.loads(line) for line in lines]
+
+
+def test_migrates_legacy_history(history_dir):
+    trainer = load_trainer()
+
+    assert read_log(history_dir) == LEGACY["task_history"]
+    assert trainer.knowledge_base == {
+        "successful_patterns": {"fetch patient": "old"},
+        "error_solutions": {"KeyError": "old"},
+    }
+    assert [t["code"] for t in trainer.find_similar_tasks("fetch patient")] == ["old"]
+    assert not (history_dir / "training_history.json").exists()
+    assert (history_dir / "training_history.json.migrated").exists()
+
+
+def test_migration_keeps_existing_log_and_patterns(history_dir):
+    newer = dict(LEGACY["task_history"][0], code="new", timestamp="2025-01-01")
+    (history_dir / "training_history.jsonl").write_text(json.dumps(newer) + "\n")
+    (history_dir / "knowledge_base.json").write_text(
+        json.dumps(
+            {"successful_patterns": {"fetch patient": "new"}, "error_solutions": {}}
+        )
+    )
+
+    trainer = load_trainer()
+
+    assert read_log(history_dir) == LEGACY["task_history"] + [newer]
+    assert trainer.knowledge_base["successful_patterns"] == {"fetch patient": "new"}
+    assert trainer.knowledge_base["error_solutions"] == {"KeyError": "old"}
+    assert [t["code"] for t in trainer.find_similar_tasks("fetch patient")] == [
+        "new",
+        "old",
+    ]
+
+
+def test_second_load_does_not_migrate_again(history_dir):
+    load_trainer()
+    log = (history_dir / "training_history.jsonl").read_bytes()
+
+    load_trainer()
+
+    assert (history_dir / "training_history.jsonl").read_bytes() == log
+
+
+def test_interrupted_migration_does_not_duplicate_entries(history_dir):
+    load_trainer()
+    # As if the process died after writing the log but before the rename
+    (history_dir / "training_history.json.migrated").rename(
+        history_dir / "training_history.json"
+    )
+
+    load_trainer()
+
+    assert read_log(history_dir) == LEGACY["task_history"]
+
+
+@pytest_asyncio.fixture
+async def worker():
+    """Execution worker with a short timeout so hung snippets fail fast"""
+    worker = CodeExecutionWorker(timeout=1)
+    await asyncio.to_thread(worker.start)
+    yield worker
+    worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_recovers_from_timeout(worker):
+    success, error = await worker.run("import time\ntime.sleep(10)")
+    assert not success
+    assert error.startswith("TimeoutError")
+
+    assert await worker.run("def main():\n    assert client is not None") == (
+        True,
+        None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_worker_recovers_from_crash(worker):
+    success, error = await worker.run("import os\nos._exit(1)")
+    assert not success
+    assert error.startswith("WorkerError")
+
+    assert await worker.run("x = 1") == (True, None)
+
+
+@pytest.mark.asyncio
+async def test_worker_does_not_rerun_failed_snippet(worker):
+    code = "raise ValueError('bad')"
+    assert await worker.run(code) == (False, "ValueError: bad")
+
+    # With the process gone, only the recorded failure can answer
+    worker.stop()
+    assert await worker.run(code) == (False, "ValueError: bad")
+
+
+GENERATED = """Here is the code:
+```python
+def main():
+    The = 1
+    print("Note: ``` inside")
+```
+This prints the patient.
+    indented prose stays
+```
+x = 2
+"""
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_code_cleaner_matches_whole_text_when_streamed(size):
+    cleaner = CodeCleaner()
+    for start in range(0, len(GENERATED), size):
+        cleaner.feed(GENERATED[start : start + size])
+
+    assert cleaner.finish() == clean_generated_code(GENERATED)
+
+
+def test_clean_generated_code_strips_fences_and_prose():
+    assert clean_generated_code(GENERATED) == (
+        "def main():\n"
+        "    The = 1\n"
+        '    print("Note: ``` inside")\n'
+        "    indented prose stays\n"
+        "x = 2\n"
+    )
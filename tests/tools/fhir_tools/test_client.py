@@ -1,5 +1,11 @@
+import asyncio
 import pytest
-from src.tools.fhir_tools.client import FHIRClient
+import httpx
+from src.tools.fhir_tools.client import (
+    FHIRClient,
+    close_async_http_clients,
+    get_async_http_client,
+)
 
 
 def test_fhir_client_initialization():
@@ -21,3 +27,89 @@ def test_get_invalid_patient():
     # Test with a non-existent patient ID
     patient = client.get_patient("nonexistent-123")
     assert patient is None
+
+
+def test_fhir_client_context_manager():
+    with FHIRClient() as client:
+        assert client.smart.server.session is not None
+
+
+def test_get_patient_reads_by_id():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path.endswith("/Patient/example"):
+            return httpx.Response(
+                200, json={"resourceType": "Patient", "id": "example"}
+            )
+        return httpx.Response(404, json={"resourceType": "OperationOutcome"})
+
+    http = httpx.Client(
+        base_url="https://fhir.test/baseR4", transport=httpx.MockTransport(handler)
+    )
+    client = FHIRClient(http=http)
+
+    assert client.get_patient("example")["id"] == "example"
+    assert client.get_patient("missing") is None
+    assert str(requests[0].url) == "https://fhir.test/baseR4/Patient/example"
+
+
+def bundle_handler(requests):
+    """Mock search endpoint returning a Bundle of every requested ID but 'missing'"""
+
+    def handler(request):
+        requests.append(request)
+        ids = request.url.params["_id"].split(",")
+        entries = [
+            {"resource": {"resourceType": "Patient", "id": patient_id}}
+            for patient_id in ids
+            if patient_id != "missing"
+        ]
+        return httpx.Response(200, json={"resourceType": "Bundle", "entry": entries})
+
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_get_patients_coalesces_reads():
+    requests = []
+
+    async with httpx.AsyncClient(
+        base_url="https://fhir.test/baseR4",
+        transport=httpx.MockTransport(bundle_handler(requests)),
+    ) as async_http:
+        client = FHIRClient(async_http=async_http)
+        patients = await client.get_patients(["a", "missing", "b", "a"])
+
+    assert [p and p["id"] for p in patients] == ["a", None, "b", "a"]
+    assert len(requests) == 1
+    assert requests[0].url.params["_id"] == "a,missing,b"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_share_one_search():
+    requests = []
+
+    async with httpx.AsyncClient(
+        base_url="https://fhir.test/baseR4",
+        transport=httpx.MockTransport(bundle_handler(requests)),
+    ) as async_http:
+        client = FHIRClient(async_http=async_http)
+        patients = await asyncio.gather(
+            client.read_patient("a"),
+            client.read_patient("b"),
+            client.read_patient("missing"),
+        )
+
+    assert [p and p["id"] for p in patients] == ["a", "b", None]
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_http_client_shared_per_loop():
+    http = get_async_http_client("https://fhir.test/baseR4")
+    assert get_async_http_client("https://fhir.test/baseR4") is http
+
+    await close_async_http_clients()
+    assert http.is_closed
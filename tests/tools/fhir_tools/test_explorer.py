@@ -1,10 +1,15 @@
 import pytest
+import pytest_asyncio
+import httpx
+from src.tools.fhir_tools.client import FHIRClient, close_async_http_clients
 from src.tools.fhir_tools.explorer import FHIRExplorer
 
 
-@pytest.fixture
-def explorer():
-    return FHIRExplorer()
+@pytest_asyncio.fixture
+async def explorer():
+    yield FHIRExplorer()
+    # Batched reads borrow the loop's shared client; close it with the loop
+    await close_async_http_clients()
 
 
 @pytest.mark.asyncio
@@ -21,3 +26,99 @@ async def test_get_patient_relationships(explorer):
     assert result is not None
     assert "references" in result
     assert isinstance(result["references"], list)
+
+
+def test_explorer_shares_client():
+    client = FHIRClient()
+    explorer = FHIRExplorer(client)
+    assert explorer.client is client
+
+
+@pytest.mark.asyncio
+async def test_get_patient_relationships_batches_reads():
+    def handler(request):
+        entries = [
+            {
+                "resource": {
+                    "resourceType": "Patient",
+                    "id": patient_id,
+                    "managingOrganization": {"reference": "Organization/1"},
+                }
+            }
+            for patient_id in request.url.params["_id"].split(",")
+        ]
+        return httpx.Response(200, json={"resourceType": "Bundle", "entry": entries})
+
+    async with httpx.AsyncClient(
+        base_url="https://fhir.test/baseR4", transport=httpx.MockTransport(handler)
+    ) as async_http:
+        explorer = FHIRExplorer(FHIRClient(async_http=async_http))
+        results = await explorer.get_patient_relationships(["a", "b"])
+
+    assert set(results) == {"a", "b"}
+    assert results["a"]["references"][0]["field"] == "managingOrganization"
+
+
+@pytest.mark.asyncio
+async def test_explore_structure_without_network(explorer):
+    result = await explorer.explore_resource_structure("Observation")
+    structure = result["structure"]
+    assert "subject" in structure["fields"]
+    assert "sample" not in structure
+
+
+def test_analyze_structure_nested_resource(explorer):
+    structure = explorer._analyze_structure(
+        {"name": [{"given": ["A"]}], "active": True, "meta": {"tag": []}}
+    )
+    assert structure == {
+        "name": {
+            "type": "array",
+            "items": {"given": {"type": "array", "items": {"type": "str"}}},
+        },
+        "active": {"type": "bool"},
+        "meta": {
+            "type": "object",
+            "properties": {"tag": {"type": "array", "items": {}}},
+        },
+    }
+
+
+def test_find_references_in_document_order(explorer):
+    references = []
+    explorer._find_references(
+        {
+            "generalPractitioner": [{"reference": "Practitioner/1"}],
+            "contact": [
+                {"organization": {"reference": "Organization/2"}, "reference": "x"}
+            ],
+        },
+        references,
+    )
+    assert references == [
+        {"path": "generalPractitioner", "reference": "Practitioner/1"},
+        {"path": "contact.organization", "reference": "Organization/2"},
+        {"path": "contact", "reference": "x"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_explore_structure_reuses_sample():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"resourceType": "Patient", "id": "example"})
+
+    http = httpx.Client(
+        base_url="https://fhir.test/baseR4", transport=httpx.MockTransport(handler)
+    )
+    for _ in range(2):
+        explorer = FHIRExplorer(FHIRClient(http=http))
+        result = await explorer.explore_resource_structure(
+            "Patient", include_sample=True
+        )
+        assert result["structure"]["sample"]["id"] == "example"
+
+    assert len(requests) == 1
+    assert requests[0].url.path == "/baseR4/Patient/example"